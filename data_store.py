@@ -1,9 +1,15 @@
 import json
 import logging
+import mmap
+import os
 import sys
 import datetime
 import random
-import collections
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 KEY_NAMES = "good_names"
 KEY_NAME = "good_name"
@@ -13,21 +19,70 @@ KEY_SEASON = "season"
 KEY_VOTES = "votes"
 CURRENT_SEASON = "11"
 TIME_FMT = '%Y-%m-%d %H:%M:%S'
+LOG_BATCH_SIZE = 16
+
+
+def _loads(data):
+    """Parses a JSON document from `str` or `bytes`, using orjson when it is installed"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _loads_mapped(fileobj):
+    """
+    Parses the JSON document in `fileobj` through a read-only memory map, so orjson can parse the page cache in
+    place rather than a copy read into a Python `bytes` object.
+    :param fileobj: (file) a file opened in binary mode
+    """
+    mm = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if orjson:
+            view = memoryview(mm)
+            try:
+                return orjson.loads(view)
+            finally:
+                view.release()
+        return json.loads(mm[:])
+    finally:
+        mm.close()
+
+
+def _normalize_name(name):
+    """
+    Strips and capitalizes a good name
+    :param name: the requested name; non-`str` values are converted first
+    :return: (str) the normalized name, or an empty string if nothing is left after stripping
+    """
+    return (name if isinstance(name, str) else str(name)).strip().capitalize()
+
+
+def _dumps(obj, indent=False):
+    """Serializes `obj` to JSON `bytes`, using orjson when it is installed"""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, separators=(',', ':')).encode('utf-8')
 
 
 class GoodName(object):
+    __slots__ = ('good_name', 'added_by', 'season', 'votes', 'date_added')
+
     def __init__(self, good_name, added_by, season=CURRENT_SEASON, votes=None, date_added=None):
-        self.good_name = good_name
+        # Interned so the name_map key and this attribute are one shared string; stored names may not be str
+        self.good_name = sys.intern(good_name if isinstance(good_name, str) else str(good_name))
         self.added_by = added_by
         self.season = season
         self.votes = votes if votes else {}
         self.date_added = date_added if date_added else datetime.datetime.utcnow().strftime(TIME_FMT)
 
+    def as_dict(self):
+        """Returns this name as a record in the store's JSON document format"""
+        return dict([(k, getattr(self, k)) for k in self.__slots__])
+
 
 class BaseDataStore(object):
     def __init__(self, loglevel='DEBUG'):
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.logger.addHandler(logging.StreamHandler(sys.stdout))
         self.logger.setLevel(loglevel)
 
     def get_good_name(self, n=None, s=None):
@@ -42,6 +97,12 @@ class BaseDataStore(object):
     def connect(self):
         pass
 
+    def flush(self):
+        return True
+
+    def close(self):
+        pass
+
 
 class FileDataStore(BaseDataStore):
     """
@@ -56,36 +117,134 @@ class FileDataStore(BaseDataStore):
     >>>   "votes":{}
     >>>  }]
     >>> }
+
+    New names are appended one record per line to a sidecar log (`<filename>.ndjson`) rather than rewriting the
+    whole document. The log is replayed on `connect` and folded back into the main
+    document by `compact`, which `connect` also runs whenever the log isn't empty. Log records are buffered and
+    written in batches of up to `LOG_BATCH_SIZE`; call `flush` to write them out sooner. Note that `add_good_name`
+    returns a name as soon as it is buffered, before it is on disk: callers that confirm the name to a user should
+    `flush` first and check its result, since names still pending when the process dies are lost.
     """
-    def __init__(self, filename, connect=False):
-        super(FileDataStore, self).__init__()
+    def __init__(self, filename, connect=False, loglevel='DEBUG'):
+        super(FileDataStore, self).__init__(loglevel)
         self.filename = filename
+        self.log_filename = filename + '.ndjson'
         self.data = None
         self.name_map = None
+        self.name_list = None
+        self._names_position = 0
+        self._logfd = None
+        self._pending = []
+        self._rng = random.Random()
         if connect:
             self.connect()
 
     def connect(self):
+        # Reconnecting must not leak the previous sidecar log descriptor
+        self.close()
         try:
-            with open(self.filename, 'r') as fin:
-                self.data = json.load(fin, object_pairs_hook=collections.OrderedDict)
-            self.name_map = dict([(d[KEY_NAME], GoodName(**d)) for d in self.data[KEY_NAMES]])
+            with open(self.filename, 'rb') as fin:
+                self.data = _loads_mapped(fin)
+            # The records live on only as GoodName objects in name_map; `_snapshot` rebuilds them for compaction.
+            # Built with a plain loop into a local dict so no list of pairs is materialized
+            name_map = {}
+            # Remember where the names sit in the document so compaction writes the keys back in their original order
+            self._names_position = list(self.data).index(KEY_NAMES)
+            for d in self.data.pop(KEY_NAMES):
+                n = GoodName(**d)
+                name_map[n.good_name] = n
+            self.name_map = name_map
+            log_lines = self._replay_log()
+            self.name_list = list(self.name_map)
+            # O_APPEND keeps each batch written by `flush` atomic with respect to other appenders
+            self._logfd = os.open(self.log_filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+            # Compacting also drops a torn tail left by a crash, which the next append would otherwise be glued onto
+            if log_lines:
+                self.compact()
         except Exception as e:
             self.data = None
             self.logger.error('Got error when attempting to open file: %s', e)
 
+    def flush(self):
+        """
+        Writes any buffered records to the sidecar log in a single append. If the write fails partway, only the bytes
+        that didn't make it stay pending, so a retry never writes a record twice.
+        :return: (bool) whether every buffered record is now in the log
+        """
+        if not self._pending:
+            return True
+        buf = b''.join(self._pending)
+        del self._pending[:]
+        try:
+            while buf:
+                buf = buf[os.write(self._logfd, buf):]
+            return True
+        except Exception as e:
+            self._pending.append(buf)
+            self.logger.error('Got error when attempting to dump current good names: %s', e)
+            return False
+
+    def close(self):
+        """Flushes and closes the sidecar log. The main document is only held open while `connect` parses it."""
+        if self._logfd is not None:
+            self.flush()
+            os.close(self._logfd)
+            self._logfd = None
+
+    def _replay_log(self):
+        """
+        Applies any records appended to the sidecar log since the last compaction. Unreadable lines are skipped.
+        :return: (int) the number of lines read, whether applied, already known or skipped
+        """
+        log_lines = 0
+        if not os.path.exists(self.log_filename):
+            return log_lines
+        with open(self.log_filename, 'rb') as fin:
+            for line in fin:
+                log_lines += 1
+                try:
+                    n = GoodName(**_loads(line))
+                except (ValueError, TypeError) as e:
+                    self.logger.warning("Skipping unreadable record in '%s': %s", self.log_filename, e)
+                    continue
+                if n.good_name not in self.name_map:
+                    self.name_map[n.good_name] = n
+        return log_lines
+
+    def compact(self):
+        """Atomically rewrites the main document with every known name and truncates the sidecar log"""
+        if not self.is_resource_connected():
+            self.logger.debug("Could not compact, resource not connected")
+            return
+        tmp_filename = self.filename + '.tmp'
+        try:
+            with open(tmp_filename, 'wb') as fout:
+                fout.write(_dumps(self._snapshot(), indent=True))
+            os.replace(tmp_filename, self.filename)
+            # Buffered records are part of the snapshot that was just written
+            del self._pending[:]
+            os.ftruncate(self._logfd, 0)
+        except Exception as e:
+            self.logger.error('Got error when attempting to compact good names: %s', e)
+
+    def _snapshot(self):
+        """Returns the full JSON document for the current state of the store"""
+        items = list(self.data.items())
+        items.insert(self._names_position, (KEY_NAMES, [n.as_dict() for n in self.name_map.values()]))
+        return dict(items)
+
     def add_good_name(self, goodname, requester):
-        goodname = str(goodname).strip().capitalize()
-        if goodname not in self.name_map:
-            n = GoodName(goodname, requester)
-            self.name_map[goodname] = n
-            self.data[KEY_NAMES].append(vars(n))
-            try:
-                with open(self.filename, 'w') as fout:
-                    json.dump(self.data, fout, indent=2, separators=(',', ':'))
-                return goodname
-            except Exception as e:
-                self.logger.error('Got error when attempting to dump current good names: %s', e)
+        goodname = _normalize_name(goodname)
+        # Duplicates are rejected before interning, so repeated requests for a known name cost a single dict probe
+        if not goodname or goodname in self.name_map:
+            return
+        n = GoodName(goodname, requester)
+        self.name_map[n.good_name] = n
+        self.name_list.append(n.good_name)
+        self._pending.append(_dumps(n.as_dict()) + b'\n')
+        if len(self._pending) >= LOG_BATCH_SIZE:
+            self.flush()
+        return n.good_name
 
     def is_resource_connected(self):
         return self.data is not None
@@ -94,4 +253,7 @@ class FileDataStore(BaseDataStore):
         if not self.is_resource_connected():
             self.logger.debug("Could not get good name, resource not connected")
             return None
-        return random.choice(self.name_map.keys())
+        if not self.name_list:
+            self.logger.debug("Could not get good name, no names recorded yet")
+            return None
+        return self.name_list[self._rng.randrange(len(self.name_list))]
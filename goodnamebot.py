@@ -3,14 +3,45 @@ import json
 import logging
 import logging.handlers
 import re
+import select
 import socket
 import sys
 import time
 from data_store import FileDataStore
 
+try:
+    # RE2 (google-re2) matches in linear time without backtracking
+    import re2
+except ImportError:
+    re2 = None
+
 from slackclient import SlackClient
 
 CONFIG_ACTIONS_KEY = 'actions'
+RTM_IDLE_TIMEOUT = 30
+# Message subtypes that are channel noise or edits rather than something a user just said
+IGNORED_SUBTYPES = frozenset(['bot_message', 'channel_join', 'channel_leave', 'channel_name', 'channel_purpose',
+                              'channel_topic', 'group_join', 'group_leave', 'message_changed', 'message_deleted'])
+# Triggers that depend on their own group numbering/names or on leading global flags, which would break (or change
+# meaning) inside the combined alternation. These are matched on their own instead.
+UNCOMBINABLE_TRIGGER = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)')
+
+
+def compile_trigger(pattern):
+    """
+    Compiles a case-insensitive trigger regex. Uses RE2 when it is installed, falling back to the stdlib `re` module
+    for patterns RE2 can't express (e.g. backreferences).
+    :param pattern: (str) the regular expression
+    :return: the compiled regular expression
+    """
+    # google-re2 has no IGNORECASE flag, so request case-insensitivity inline for both engines
+    pattern = '(?i)' + pattern
+    if re2:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            pass
+    return re.compile(pattern)
 
 
 class MessageHandler(object):
@@ -27,16 +58,19 @@ class MessageHandler(object):
         self.target = target
         self.name = target.__name__
 
-    def handle_message(self, data):
+    def handle_message(self, data, text):
         """
         Checks if the provided data matches this handler's regex. If so, invokes the target. 
         :param data: (dict) A message from Slack
+        :param text: (str) The message's text, already stripped of surrounding whitespace
+        :return: (bool) whether the target was invoked
         """
         if not data:
-            return
-        match = self.regex.match(data.get('text').strip())
+            return False
+        match = self.regex.match(text)
         if match:
             self.target(data, match)
+        return bool(match)
 
 
 class Bot(SlackClient):
@@ -46,16 +80,31 @@ class Bot(SlackClient):
         :param token: (str) The bot's access token
         :param actions: (list) A map that includes a trigger regex and a method name on this object. Format:
         >>> [{"action": "post_good_name_alert", "trigger": ".*name alert.*"}]
+        When several triggers match a message, only the first listed action runs.
         :param data_store: (BaseDataStore) a data store object to use to fetch/retrieve good name data
         :param loglevel: (str) A python `logging` module-compatible log level argument
         """
         super(Bot, self).__init__(token)
         self.data_store = data_store
         self.logger = logging.getLogger('goodnamebot.Bot')
-        self.logger.addHandler(logging.StreamHandler(sys.stdout))
         self.logger.setLevel(loglevel)
-        self._handlers = [MessageHandler(re.compile(a['trigger'], re.IGNORECASE),
+        self._handlers = [MessageHandler(compile_trigger(a['trigger']),
                                          getattr(self, a['action'], self.missing_action)) for a in actions]
+        # Triggers are folded into one alternation, so a message is scanned once to find the first matching one;
+        # group hN wraps self._handlers[N]. The winning handler then re-matches to get its own group numbering.
+        combinable = [i for i, a in enumerate(actions) if not UNCOMBINABLE_TRIGGER.search(a['trigger'])]
+        self._combined = None
+        if combinable:
+            try:
+                self._combined = compile_trigger('|'.join('(?P<h{}>{})'.format(i, actions[i]['trigger'])
+                                                          for i in combinable))
+            except re.error as e:
+                self.logger.warning("Could not combine triggers, matching each one separately: %s", e)
+                combinable = []
+        # The actions never change after startup, so resolve each hN group's number to its handler up front
+        self._dispatch = dict([(self._combined.groupindex['h{}'.format(i)], (i, self._handlers[i]))
+                               for i in combinable])
+        self._standalone = [(i, h) for i, h in enumerate(self._handlers) if i not in combinable]
 
     def rtm_read(self):
         """
@@ -77,16 +126,46 @@ class Bot(SlackClient):
             raise
         self.logger.info("Connection established.")
 
+    def _wait_for_data(self, timeout=RTM_IDLE_TIMEOUT):
+        """
+        Blocks until the RTM websocket has something to read, so the loop in `run` sleeps while the channel is quiet
+        :param timeout: (float) the maximum number of seconds to wait
+        """
+        sock = self.server.websocket.sock
+        # Frames already decrypted into the SSL buffer wouldn't wake select()
+        if getattr(sock, 'pending', None) and sock.pending():
+            return
+        select.select([sock], [], [], timeout)
+
     def _log_and_return(self, data):
         """Logs the data and passes it through"""
-        if data:
-            self.logger.debug(data)
+        if data and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('%r', data)
         return data
 
     def _handle_data(self, data):
-        if data.get('type') != 'message' or not data.get('text', '').strip():
+        # Most RTM traffic is typing/presence events, so reject on type before looking at anything else
+        if data.get('type') != 'message' or data.get('subtype') in IGNORED_SUBTYPES:
+            return
+        text = data.get('text')
+        if not text:
+            return
+        text = text.strip()
+        if not text:
             return
-        [h.handle_message(data) for h in self._handlers]
+        first = None
+        if self._combined:
+            match = self._combined.match(text)
+            if match:
+                first = self._dispatch.get(match.lastindex)
+        # Standalone triggers listed ahead of the combined hit still get first pick
+        for i, handler in self._standalone:
+            if first and i > first[0]:
+                break
+            if handler.handle_message(data, text):
+                return
+        if first:
+            first[1].handle_message(data, text)
 
     def post_good_name_alert(self, data, match):
         """
@@ -96,9 +175,11 @@ class Bot(SlackClient):
 
     def add_good_name(self, data, match):
         """Idempotently adds a good name to the data store"""
-        self.logger.debug("Match: %s", match.groups())
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Match: %s", match.groups())
         added_name = self.data_store.add_good_name(match.group(1), data['user'])
-        if added_name:
+        # Only confirm once the name has actually been written out
+        if added_name and self.data_store.flush():
             self.send_msg(data['channel'], "Good name {} recorded.".format(added_name))
 
     def missing_action(self, data, match):
@@ -113,20 +194,30 @@ class Bot(SlackClient):
     def run(self):
         while True:
             try:
-                [self._handle_data(item) for item in self.rtm_read()]
+                self._wait_for_data()
+                for item in self.rtm_read():
+                    self._handle_data(item)
+                # Names added while handling this batch of events go out in one write
+                self.data_store.flush()
             except Exception as e:
                 self.logger.error("Got exception when attempting to read! %s", e)
+                time.sleep(1)
                 self.initialize()
-            time.sleep(1)
 
 
 def main(token, **kwargs):
     if CONFIG_ACTIONS_KEY not in kwargs:
         raise KeyError("Config did not contain a value for key: " + CONFIG_ACTIONS_KEY)
-    client = Bot(token, kwargs[CONFIG_ACTIONS_KEY], FileDataStore('good_names.json', connect=True))
-    client.initialize()
-    perform_debug_calls(client, kwargs.get("debug_calls", []))
-    client.run()
+    loglevel = kwargs.get('loglevel', 'DEBUG')
+    logging.basicConfig(stream=sys.stdout, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    data_store = FileDataStore('good_names.json', connect=True, loglevel=loglevel)
+    client = Bot(token, kwargs[CONFIG_ACTIONS_KEY], data_store, loglevel=loglevel)
+    try:
+        client.initialize()
+        perform_debug_calls(client, kwargs.get("debug_calls", []))
+        client.run()
+    finally:
+        data_store.close()
 
 
 def perform_debug_calls(client, debug_calls):
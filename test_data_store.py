@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from data_store import FileDataStore, KEY_NAME, KEY_NAMES
+
+
+class FileDataStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'good_names.json')
+        self.write_document([{KEY_NAME: 'Jerry mander', 'added_by': 'U1'}])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_document(self, names):
+        with open(self.filename, 'w') as fout:
+            json.dump({KEY_NAMES: names}, fout)
+
+    def read_document_names(self):
+        with open(self.filename, 'r') as fin:
+            return [d[KEY_NAME] for d in json.load(fin)[KEY_NAMES]]
+
+    def read_log(self):
+        with open(self.filename + '.ndjson', 'rb') as fin:
+            return fin.read()
+
+    def connect(self):
+        store = FileDataStore(self.filename, connect=True)
+        self.addCleanup(store.close)
+        self.assertTrue(store.is_resource_connected())
+        return store
+
+    def test_add_appends_to_log_only(self):
+        store = self.connect()
+        self.assertEqual(store.add_good_name('  alice ', 'U2'), 'Alice')
+        store.close()
+        self.assertEqual(self.read_document_names(), ['Jerry mander'])
+        records = [json.loads(line) for line in self.read_log().splitlines()]
+        self.assertEqual([r[KEY_NAME] for r in records], ['Alice'])
+        self.assertEqual(records[0]['added_by'], 'U2')
+
+    def test_add_rejects_duplicates_and_empty_names(self):
+        store = self.connect()
+        self.assertIsNone(store.add_good_name('JERRY MANDER', 'U2'))
+        self.assertIsNone(store.add_good_name('   ', 'U2'))
+        self.assertEqual(store.name_list, ['Jerry mander'])
+
+    def test_add_capitalizes_like_str_capitalize(self):
+        store = self.connect()
+        self.assertEqual(store.add_good_name(u'\u00dfen', 'U2'), u'Ssen')
+        self.assertEqual(store.add_good_name(u'\u01c6emal', 'U2'), u'\u01c5emal')
+
+    def test_get_good_name_on_empty_store_returns_none(self):
+        self.write_document([])
+        store = self.connect()
+        self.assertIsNone(store.get_good_name())
+        store.add_good_name('alice', 'U2')
+        self.assertEqual(store.get_good_name(), 'Alice')
+
+    def test_connect_replays_and_compacts_log(self):
+        store = self.connect()
+        store.add_good_name('alice', 'U2')
+        store.add_good_name('bob', 'U2')
+        store.close()
+        store = self.connect()
+        self.assertEqual(store.name_list, ['Jerry mander', 'Alice', 'Bob'])
+        self.assertEqual(self.read_document_names(), ['Jerry mander', 'Alice', 'Bob'])
+        self.assertEqual(self.read_log(), b'')
+
+    def test_compact_folds_pending_and_logged_names(self):
+        store = self.connect()
+        store.add_good_name('alice', 'U2')
+        store.flush()
+        store.add_good_name('bob', 'U2')
+        store.compact()
+        self.assertEqual(self.read_document_names(), ['Jerry mander', 'Alice', 'Bob'])
+        self.assertEqual(self.read_log(), b'')
+        store.close()
+        self.assertEqual(self.read_log(), b'')
+
+    def test_compact_keeps_document_key_order(self):
+        with open(self.filename, 'w') as fout:
+            json.dump({'first': 1, KEY_NAMES: [], 'last': 2}, fout)
+        store = self.connect()
+        store.add_good_name('alice', 'U2')
+        store.compact()
+        with open(self.filename, 'r') as fin:
+            self.assertEqual(list(json.load(fin)), ['first', KEY_NAMES, 'last'])
+
+    def test_non_str_stored_names_are_loaded_as_str(self):
+        self.write_document([{KEY_NAME: 1984, 'added_by': 'U1'}])
+        store = self.connect()
+        self.assertEqual(store.name_list, ['1984'])
+        self.assertIsNone(store.add_good_name(1984, 'U2'))
+        self.assertIs(store.name_list[0], store.name_map['1984'].good_name)
+
+    def test_flush_retries_only_unwritten_bytes(self):
+        store = self.connect()
+        store.add_good_name('alice', 'U2')
+        store.add_good_name('bob', 'U2')
+        real_write = os.write
+        calls = []
+
+        def partial_write(fd, data):
+            calls.append(data)
+            if len(calls) == 1:
+                return real_write(fd, data[:10])
+            raise OSError('disk full')
+
+        with mock.patch('data_store.os.write', partial_write):
+            store.flush()
+        store.flush()
+        store.close()
+        self.assertEqual(calls[1], calls[0][10:])
+        self.assertEqual([json.loads(line)[KEY_NAME] for line in self.read_log().splitlines()], ['Alice', 'Bob'])
+
+    def test_flush_reports_failure(self):
+        store = self.connect()
+        self.assertTrue(store.flush())
+        store.add_good_name('alice', 'U2')
+        with mock.patch('data_store.os.write', side_effect=OSError('disk full')):
+            self.assertFalse(store.flush())
+        self.assertTrue(store.flush())
+
+    def test_reconnect_closes_previous_log_descriptor(self):
+        store = self.connect()
+        open_fds = len(os.listdir('/dev/fd'))
+        store.connect()
+        self.assertEqual(len(os.listdir('/dev/fd')), open_fds)
+
+    def test_torn_log_tail_does_not_swallow_later_names(self):
+        with open(self.filename + '.ndjson', 'wb') as fout:
+            fout.write(b'{"good_name":"Tor')
+        store = self.connect()
+        self.assertEqual(store.name_list, ['Jerry mander'])
+        store.add_good_name('alice', 'U2')
+        store.close()
+        store = self.connect()
+        self.assertEqual(store.name_list, ['Jerry mander', 'Alice'])
+
+    def test_log_lines_that_are_not_records_are_skipped(self):
+        with open(self.filename + '.ndjson', 'wb') as fout:
+            fout.write(b'{"foo":1}\n1\n{"good_name":"Alice","added_by":"U2"}\n')
+        store = self.connect()
+        self.assertEqual(store.name_list, ['Jerry mander', 'Alice'])
+        self.assertEqual(self.read_log(), b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import sys
+import types
+import unittest
+from unittest import mock
+
+try:
+    import slackclient  # noqa: F401
+except ImportError:
+    # Bot only needs SlackClient as a base class here; nothing in these tests talks to Slack
+    slackclient = types.ModuleType('slackclient')
+
+    class SlackClient(object):
+        def __init__(self, token):
+            self.token = token
+
+    slackclient.SlackClient = SlackClient
+    sys.modules['slackclient'] = slackclient
+
+import goodnamebot
+from data_store import BaseDataStore
+
+ALERT = {"action": "post_good_name_alert", "trigger": ".*name alert.*"}
+ADD = {"action": "add_good_name", "trigger": "!gna(.+)"}
+
+
+class FakeDataStore(BaseDataStore):
+    def __init__(self):
+        super(FakeDataStore, self).__init__('WARNING')
+        self.added = []
+
+    def get_good_name(self, n=None, s=None):
+        return 'Jerry mander'
+
+    def add_good_name(self, goodname, requester):
+        self.added.append(goodname)
+        return goodname.strip()
+
+
+class RecordingBot(goodnamebot.Bot):
+    def __init__(self, actions):
+        self.sent = []
+        super(RecordingBot, self).__init__('token', actions, FakeDataStore(), loglevel='ERROR')
+
+    def send_msg(self, target_id, text):
+        self.sent.append(text)
+
+
+class UncombinableTriggerTest(unittest.TestCase):
+    def test_detects_triggers_that_cannot_share_the_alternation(self):
+        for trigger in [r'(a)\1', '(?i)x', '(?P<n>x)', '(?P<n>x)(?P=n)', '(?(1)a|b)']:
+            self.assertTrue(goodnamebot.UNCOMBINABLE_TRIGGER.search(trigger), trigger)
+
+    def test_allows_plain_triggers(self):
+        for trigger in [ALERT['trigger'], ADD['trigger'], '(?:x)', '(?i:x)y', '((a)(b))c']:
+            self.assertFalse(goodnamebot.UNCOMBINABLE_TRIGGER.search(trigger), trigger)
+
+
+class DispatchTest(unittest.TestCase):
+    """Runs against the stdlib `re` module; `Re2DispatchTest` repeats every case with RE2"""
+    re2 = None
+
+    def setUp(self):
+        patcher = mock.patch.object(goodnamebot, 're2', self.re2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handle(self, bot, text, **extra):
+        data = {'type': 'message', 'channel': 'C1', 'user': 'U1', 'text': text}
+        data.update(extra)
+        bot._handle_data(data)
+        return bot.sent
+
+    def test_compiles_with_the_selected_engine(self):
+        bot = RecordingBot([ALERT, ADD])
+        engine = 're2' if self.re2 else 're'
+        self.assertEqual(type(bot._combined).__module__, engine)
+        self.assertEqual(type(bot._handlers[0].regex).__module__, engine)
+
+    def test_dispatches_each_trigger_case_insensitively(self):
+        bot = RecordingBot([ALERT, ADD])
+        self.assertEqual(self.handle(bot, 'hey NAME ALERT'), ['Good name: Jerry mander'])
+        self.assertEqual(self.handle(bot, '!GNA  alice '), ['Good name: Jerry mander', 'Good name alice recorded.'])
+        self.assertEqual(bot.data_store.added, ['  alice'])
+
+    def test_unmatched_and_ignored_messages_do_nothing(self):
+        bot = RecordingBot([ALERT, ADD])
+        self.handle(bot, 'nothing to see')
+        self.handle(bot, '   ')
+        self.handle(bot, 'name alert', subtype='channel_join')
+        bot._handle_data({'type': 'user_typing'})
+        self.assertEqual(bot.sent, [])
+
+    def test_user_message_subtypes_still_match(self):
+        bot = RecordingBot([ALERT])
+        self.assertEqual(self.handle(bot, 'name alert', subtype='thread_broadcast'), ['Good name: Jerry mander'])
+
+    def test_only_first_listed_matching_action_runs(self):
+        # Behaviour change from matching every handler: this used to run add_good_name as well
+        bot = RecordingBot([ALERT, ADD])
+        self.assertEqual(self.handle(bot, '!gna name alert'), ['Good name: Jerry mander'])
+        self.assertEqual(bot.data_store.added, [])
+
+    def test_nested_groups_resolve_to_the_right_handler(self):
+        bot = RecordingBot([{"action": "post_good_name_alert", "trigger": "((x)(y))+z"}, ADD])
+        self.assertEqual(self.handle(bot, '!gna bob'), ['Good name bob recorded.'])
+        self.assertEqual(self.handle(bot, 'xyxyz'), ['Good name bob recorded.', 'Good name: Jerry mander'])
+
+    def test_standalone_trigger_listed_first_gets_first_pick(self):
+        bot = RecordingBot([{"action": "add_good_name", "trigger": "(?i)!gna(.+)"}, ALERT])
+        self.assertEqual(bot._standalone, [(0, bot._handlers[0])])
+        self.assertEqual(self.handle(bot, '!gna name alert'), ['Good name name alert recorded.'])
+
+    def test_standalone_trigger_listed_after_a_combined_hit_is_skipped(self):
+        bot = RecordingBot([ALERT, {"action": "add_good_name", "trigger": "(?i)!gna(.+)"}])
+        self.assertEqual(self.handle(bot, '!gna name alert'), ['Good name: Jerry mander'])
+        self.assertEqual(self.handle(bot, '!gna carol'), ['Good name: Jerry mander', 'Good name carol recorded.'])
+
+    def test_backreference_triggers_still_work(self):
+        bot = RecordingBot([{"action": "add_good_name", "trigger": r"(\w)\1 (.+)"}])
+        self.assertEqual(self.handle(bot, 'aa dave'), ['Good name a recorded.'])
+        self.assertEqual(self.handle(bot, 'ab dave'), ['Good name a recorded.'])
+
+    def test_falls_back_to_standalone_matching_when_combining_fails(self):
+        never = goodnamebot.re.compile('(?!)')
+        with mock.patch.object(goodnamebot, 'UNCOMBINABLE_TRIGGER', never):
+            bot = RecordingBot([{"action": "add_good_name", "trigger": r"(\w)\1 (.+)"}, ALERT])
+        self.assertIsNone(bot._combined)
+        self.assertEqual(len(bot._standalone), 2)
+        self.assertEqual(self.handle(bot, 'bb name alert'), ['Good name b recorded.'])
+        self.assertEqual(self.handle(bot, 'name alert'), ['Good name b recorded.', 'Good name: Jerry mander'])
+
+    def test_no_actions(self):
+        bot = RecordingBot([])
+        self.assertIsNone(bot._combined)
+        self.assertEqual(self.handle(bot, 'name alert'), [])
+
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+
+@unittest.skipUnless(re2, 'google-re2 is not installed')
+class Re2DispatchTest(DispatchTest):
+    re2 = re2
+
+
+if __name__ == '__main__':
+    unittest.main()